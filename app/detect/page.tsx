@@ -288,6 +288,15 @@ export default function DetectPage() {
     }
   }
 
+  // Annotated images are rendered by the backend on first request via image_url
+  const resultImageSrc = (result?: { image: string | null; image_url?: string } | null) => {
+    if (!result) return undefined
+    if (result.image) return result.image
+    if (!result.image_url) return undefined
+    const backendUrl = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://127.0.0.1:5000'
+    return `${backendUrl}${result.image_url}`
+  }
+
   const handleDetect = async () => {
   if (!uploadedImage) return
   setIsLoading(true)
@@ -374,6 +383,8 @@ export default function DetectPage() {
           confidence: confidence,
           iou: iouThreshold,
           filter_animals: filterAnimals,
+          // Only the boxes are drawn, so the server needn't keep the frame
+          store_result: false,
         }),
         mode: 'cors',
       })
@@ -594,6 +605,8 @@ export default function DetectPage() {
           confidence: confidence,
           iou: iouThreshold,
           filter_animals: filterAnimals,
+          // Only the boxes are drawn, so the server needn't keep the frame
+          store_result: false,
         }),
         mode: 'cors',
       })
@@ -1034,21 +1047,21 @@ export default function DetectPage() {
                 <div className="relative w-full h-full overflow-auto">
                   {selectedModel === 'compare' ? (
                     <div className="flex h-full gap-4 p-4">
-                      {detectionResults.yolov8n?.image && (
+                      {resultImageSrc(detectionResults.yolov8n) && (
                         <div className="flex-1 flex flex-col">
                           <p className="text-cyan-400 text-sm font-semibold mb-2">YOLOv8n Results</p>
-                          <img src={detectionResults.yolov8n.image} alt="YOLOv8n Detection" className="flex-1 object-contain" />
+                          <img src={resultImageSrc(detectionResults.yolov8n)} alt="YOLOv8n Detection" className="flex-1 object-contain" />
                         </div>
                       )}
-                      {detectionResults.best?.image && (
+                      {resultImageSrc(detectionResults.best) && (
                         <div className="flex-1 flex flex-col">
                           <p className="text-cyan-400 text-sm font-semibold mb-2">Custom best.pt Results</p>
-                          <img src={detectionResults.best.image} alt="Custom Detection" className="flex-1 object-contain" />
+                          <img src={resultImageSrc(detectionResults.best)} alt="Custom Detection" className="flex-1 object-contain" />
                         </div>
                       )}
                     </div>
                   ) : (
-                    <img src={detectionResults[selectedModel]?.image || detectionResults.yolov8n?.image} alt="Detection Result" className="w-full h-full object-contain" />
+                    <img src={resultImageSrc(detectionResults[selectedModel]) || resultImageSrc(detectionResults.yolov8n)} alt="Detection Result" className="w-full h-full object-contain" />
                   )}
                 </div>
               ) : (
@@ -1,5 +1,6 @@
 export interface Detection {
   class: string;
+  class_id?: number;
   confidence: number;
   bbox: [number, number, number, number];
   width: number;
@@ -10,6 +11,7 @@ export interface DetectionResult {
   detections: Detection[];
   inference_time: number;
   image: string | null;
+  image_url?: string;
   object_count: number;
   avg_confidence: number;
 }
@@ -0,0 +1,261 @@
+"""
+Async (ASGI) backend for WildSnap - Animal Detection API
+Same endpoints and JSON as backend.py. Request bodies are received on the
+event loop; only decoding and inference run in executor threads, so slow
+uploads never hold the model.
+
+Run with: uvicorn asgi_backend:app --host 0.0.0.0 --port 5000
+"""
+
+from quart import Quart, Response, request, jsonify, send_file
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+from detection import ImageTooLarge
+from profiling import maybe_profile, profiled, profile_path, is_admin
+from serving import (
+    init_inference, request_roi_profile, decode_upload, parse_detect_json, parse_detect_form,
+    detection_payload, health_payload, models_payload,
+    profiles_payload, profiles_summary_payload, metrics_payload, result_image,
+    cameras_payload, camera_roi_payload, set_camera_roi_payload, delete_camera_roi_payload,
+    is_flag_set, API_INFO, INFERENCE_WORKERS
+)
+
+
+app = Quart(__name__)
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get("WILDSNAP_MAX_UPLOAD_MB", 64)) * 1024 * 1024
+# Slow clients may take a while to finish uploading; they only cost a socket here
+app.config['BODY_TIMEOUT'] = int(os.environ.get("WILDSNAP_BODY_TIMEOUT", 300))
+
+# Manual CORS implementation
+@app.after_request
+async def after_request(response):
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Admin-Token')
+    response.headers.add('Access-control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    return response
+
+@app.before_request
+async def handle_preflight():
+    if request.method == "OPTIONS":
+        return '', 200
+
+# --- MODEL LOADING ---
+# Spawned inference workers re-import __main__ as __mp_main__; only the server
+# loads models. uvicorn's --workers/--reload processes are spawned too, so
+# mp.parent_process() can't tell them apart from inference workers
+if __name__ != '__mp_main__':
+    init_inference()
+
+# --- EXECUTORS ---
+# Decoding releases the GIL inside PIL, so it gets its own small pool.
+# Inference is serialised per model copy: one thread in-process, or one
+# thread per pool worker (those threads just wait on the worker pipe).
+decode_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("WILDSNAP_DECODE_THREADS", 2)),
+    thread_name_prefix="wildsnap-decode"
+)
+inference_executor = ThreadPoolExecutor(
+    max_workers=max(1, INFERENCE_WORKERS),
+    thread_name_prefix="wildsnap-inference"
+)
+
+async def run_in(executor, func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, func, *args)
+
+# --- API ROUTES ---
+
+@app.route('/api/health', methods=['GET'])
+async def health():
+    """Health check endpoint"""
+    payload, status = health_payload()
+    return jsonify(payload), status
+
+@app.route('/api/detect', methods=['POST'])
+async def detect():
+    """
+    Main detection endpoint, see backend.detect for the JSON format
+    """
+    try:
+        data = await request.get_json()
+
+        # Get parameters
+        image_data, model_choice, confidence, iou, filter_animals = parse_detect_json(data)
+
+        if not image_data:
+            return jsonify({'error': 'No image provided'}), 400
+
+        inline_image = is_flag_set(data.get('inline_image'))
+        store_result = is_flag_set(data.get('store_result', True))
+        roi_profile, error = request_roi_profile(data.get('camera_id'))
+        if error:
+            payload, status = error
+            return jsonify(payload), status
+        profile = maybe_profile(
+            is_flag_set(data.get('profile')), request.headers.get('X-Admin-Token'), '/api/detect'
+        )
+        img_np, scale = await run_in(
+            decode_executor, profiled, profile, 'decode', decode_upload, image_data, roi_profile
+        )
+        payload, status = await run_in(
+            inference_executor, detection_payload,
+            img_np, model_choice, confidence, iou, filter_animals, profile, scale,
+            inline_image, roi_profile, store_result
+        )
+        return jsonify(payload), status
+
+    except ImageTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+
+    except Exception as e:
+        print(f"Error in /api/detect: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/models', methods=['GET'])
+async def get_models_info():
+    """Get available models info"""
+    payload, status = models_payload()
+    return jsonify(payload), status
+
+@app.route('/api/detect-file', methods=['POST'])
+async def detect_file():
+    """
+    Detect from uploaded file
+    """
+    try:
+        files = await request.files
+        form = await request.form
+
+        if 'file' not in files:
+            return jsonify({'error': 'No file provided'}), 400
+
+        file = files['file']
+        model_choice, confidence, iou, filter_animals = parse_detect_form(form)
+
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+
+        inline_image = is_flag_set(form.get('inline_image'))
+        store_result = is_flag_set(form.get('store_result', 'true'))
+        roi_profile, error = request_roi_profile(form.get('camera_id'))
+        if error:
+            payload, status = error
+            return jsonify(payload), status
+        profile = maybe_profile(
+            is_flag_set(form.get('profile')), request.headers.get('X-Admin-Token'), '/api/detect-file'
+        )
+        img_np, scale = await run_in(
+            decode_executor, profiled, profile, 'decode', decode_upload, file.stream, roi_profile
+        )
+        payload, status = await run_in(
+            inference_executor, detection_payload,
+            img_np, model_choice, confidence, iou, filter_animals, profile, scale,
+            inline_image, roi_profile, store_result
+        )
+        return jsonify(payload), status
+
+    except ImageTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+
+    except Exception as e:
+        print(f"Error in /api/detect-file: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/results/<result_id>/image', methods=['GET'])
+async def get_result_image(result_id):
+    """
+    Annotated image for a detect result, rendered on first request and cached
+    Query: model, size (max long side in px), format (png | jpeg | webp)
+    """
+    rendered, error = await run_in(
+        decode_executor, result_image,
+        result_id, request.args.get('model'), request.args.get('size', type=int),
+        request.args.get('format', 'png').lower()
+    )
+    if error:
+        payload, status = error
+        return jsonify(payload), status
+    image_bytes, mimetype = rendered
+    return Response(image_bytes, mimetype=mimetype, headers={'Cache-Control': 'private, max-age=600'})
+
+@app.route('/api/cameras', methods=['GET'])
+async def get_cameras():
+    """List camera ROI profiles"""
+    payload, status = cameras_payload()
+    return jsonify(payload), status
+
+@app.route('/api/cameras/<camera_id>/roi', methods=['GET', 'PUT', 'DELETE'])
+async def camera_roi(camera_id):
+    """
+    Camera region of interest, coordinates are fractions (0-1) of the frame
+    PUT JSON:
+    {
+        "include": [{"rect": [x1, y1, x2, y2]} | {"polygon": [[x, y], ...]}],
+        "exclude": [...same shapes...]
+    }
+    """
+    admin_token = request.headers.get('X-Admin-Token')
+    if request.method == 'PUT':
+        payload, status = set_camera_roi_payload(camera_id, await request.get_json(silent=True), admin_token)
+    elif request.method == 'DELETE':
+        payload, status = delete_camera_roi_payload(camera_id, admin_token)
+    else:
+        payload, status = camera_roi_payload(camera_id)
+    return jsonify(payload), status
+
+@app.route('/api/metrics', methods=['GET'])
+async def get_metrics():
+    """Decode counters: time spent and memory saved by reduced decoding"""
+    payload, status = metrics_payload()
+    return jsonify(payload), status
+
+@app.route('/api/profiles', methods=['GET'])
+async def get_profiles():
+    """List saved request profiles (admin)"""
+    payload, status = profiles_payload(request.headers.get('X-Admin-Token'))
+    return jsonify(payload), status
+
+@app.route('/api/profiles/summary', methods=['GET'])
+async def get_profiles_summary():
+    """Hottest functions and mean stage times across saved profiles (admin)"""
+    payload, status = profiles_summary_payload(
+        request.headers.get('X-Admin-Token'), request.args.get('limit', 20, type=int)
+    )
+    return jsonify(payload), status
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+async def download_profile(profile_id):
+    """Download a cProfile trace, open with pstats or snakeviz (admin)"""
+    if not is_admin(request.headers.get('X-Admin-Token')):
+        return jsonify({'error': 'Admin token required'}), 403
+    path = profile_path(profile_id)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return await send_file(path, as_attachment=True, mimetype='application/octet-stream')
+
+@app.route('/', methods=['GET'])
+async def index():
+    """Root endpoint"""
+    return jsonify(API_INFO), 200
+
+# --- ERROR HANDLERS ---
+
+@app.errorhandler(404)
+async def not_found(error):
+    return jsonify({'error': 'Endpoint not found'}), 404
+
+@app.errorhandler(500)
+async def internal_error(error):
+    return jsonify({'error': 'Internal server error'}), 500
+
+# --- MAIN ---
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("=" * 50)
+    print("🐾 WildSnap Async Backend API Starting...")
+    print("=" * 50)
+
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get("PORT", 5000)))
@@ -3,19 +3,17 @@ Flask backend for WildSnap - Animal Detection API
 Integrates YOLOv8 models for real-time animal detection
 """
 
-from flask import Flask, request, jsonify
-from ultralytics import YOLO
-from PIL import Image
-import numpy as np
-import base64
-import io
-import time
-import json
+from flask import Flask, Response, request, jsonify, send_file
 import os
-from datetime import datetime
-import torch
-from ultralytics.nn.tasks import DetectionModel
-from torch.nn import Sequential
+from detection import ImageTooLarge
+from profiling import maybe_profile, profiled, profile_path, is_admin
+from serving import (
+    init_inference, request_roi_profile, decode_upload, parse_detect_json, parse_detect_form,
+    detection_payload, health_payload, models_payload,
+    profiles_payload, profiles_summary_payload, metrics_payload, result_image,
+    cameras_payload, camera_roi_payload, set_camera_roi_payload, delete_camera_roi_payload,
+    is_flag_set, API_INFO
+)
 
 
 app = Flask(__name__)
@@ -24,7 +22,7 @@ app = Flask(__name__)
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Admin-Token')
     response.headers.add('Access-control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
@@ -34,127 +32,21 @@ def handle_preflight():
         return '', 200
 
 # --- MODEL LOADING ---
-models = {}
-
-def load_models():
-    """Load YOLOv8 models at startup"""
-    # Add the required model classes to the list of safe globals
-    torch.serialization.add_safe_globals([DetectionModel, Sequential])
-    try:
-        print("Loading YOLOv8n model...")
-        models['yolov8n'] = YOLO("yolov8n.pt")
-        print("✓ YOLOv8n loaded successfully")
-    except Exception as e:
-        print(f"✗ Error loading yolov8n: {e}")
-        models['yolov8n'] = None
-    
-    try:
-        print("Loading best.pt model...")
-        models['best'] = YOLO("best.pt")
-        print("✓ best.pt loaded successfully")
-    except Exception as e:
-        print(f"⚠ Warning: best.pt not found: {e}")
-        models['best'] = None
-
-# Load models when app starts
-load_models()
-
-# --- HELPER FUNCTIONS ---
-
-def encode_image_to_base64(image_pil):
-    """Convert PIL image to base64 string"""
-    buffered = io.BytesIO()
-    image_pil.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    return f"data:image/png;base64,{img_str}"
-
-def run_detection(model, image_data, conf_threshold, iou_threshold, filter_animals=False):
-    """
-    Run YOLO detection on image
-    Returns: annotated_image, detections, inference_time
-    """
-
-    image = image.convert("RGB")
-    image.thumbnail((640, 640))
-    img_np = np.array(image)
-
-    if model is None:
-        return None, [], 0
-    
-    try:
-        # Convert base64 to PIL Image
-        if isinstance(image_data, str) and image_data.startswith('data:image'):
-            # Remove data URL prefix
-            image_data = image_data.split(',')[1]
-            image_bytes = base64.b64decode(image_data)
-            image = Image.open(io.BytesIO(image_bytes))
-        else:
-            image = Image.open(image_data)
-        
-        img_np = np.array(image.convert("RGB"))
-        
-        # Run inference
-        start_time = time.time()
-        results = model.predict(
-            source=img_np,
-            conf=conf_threshold,
-            iou=iou_threshold,
-            verbose=False
-        )
-        inference_time = (time.time() - start_time) * 1000  # milliseconds
-        
-        # Create annotated image
-        annotated_bgr = results[0].plot()
-        annotated_rgb = annotated_bgr[..., ::-1]
-        annotated_image_pil = Image.fromarray(annotated_rgb)
-        
-        # Extract detections
-        detections = []
-        animal_classes = {
-            'bird', 'cat', 'dog', 'horse', 'sheep', 'cow',
-            'elephant', 'bear', 'zebra', 'giraffe', 'person'
-        }
-        
-        for r in results:
-            for box in r.boxes:
-                cls_id = int(box.cls.item())
-                class_name = model.names.get(cls_id, str(cls_id))
-                
-                # Filter animals if requested (only for yolov8n)
-                if filter_animals and model.model_name == 'YOLOv8n':
-                    if class_name.lower() not in animal_classes:
-                        continue
-                
-                xyxy = box.xyxy[0].tolist()
-                x1, y1, x2, y2 = map(int, xyxy)
-                conf = float(box.conf.item())
-                
-                detections.append({
-                    "class": class_name,
-                    "confidence": round(conf, 4),
-                    "bbox": [x1, y1, x2, y2],
-                    "width": x2 - x1,
-                    "height": y2 - y1
-                })
-        
-        return annotated_image_pil, detections, inference_time
-    
-    except Exception as e:
-        print(f"Error in detection: {e}")
-        return None, [], 0
+# Spawned inference workers re-import __main__ as __mp_main__; only the server
+# loads models (uvicorn/gunicorn worker processes import this module normally).
+# With debug=True `python backend.py` first runs as the reloader parent, which
+# only watches files and restarts the child that actually serves requests
+_reloader_parent = __name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+if __name__ != '__mp_main__' and not _reloader_parent:
+    init_inference()
 
 # --- API ROUTES ---
 
 @app.route('/api/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({
-        'status': 'ok',
-        'models_loaded': {
-            'yolov8n': models['yolov8n'] is not None,
-            'best': models['best'] is not None
-        }
-    }), 200
+    payload, status = health_payload()
+    return jsonify(payload), status
 
 @app.route('/api/detect', methods=['POST'])
 def detect():
@@ -166,105 +58,41 @@ def detect():
         "model": "yolov8n" | "best" | "compare",
         "confidence": 0.0-1.0,
         "iou": 0.0-1.0,
-        "filter_animals": true/false
+        "filter_animals": true/false,
+        "profile": true/false (admin only, needs X-Admin-Token),
+        "inline_image": true/false (embed the annotated image instead of image_url),
+        "store_result": true/false (false: boxes only, no image_url, e.g. live frames),
+        "camera_id": "..." (apply that camera's ROI profile)
     }
     """
     try:
         data = request.get_json()
         
         # Get parameters
-        image_data = data.get('image')
-        model_choice = data.get('model', 'yolov8n')
-        confidence = float(data.get('confidence', 0.4))
-        iou = float(data.get('iou', 0.5))
-        filter_animals = data.get('filter_animals', False)
+        image_data, model_choice, confidence, iou, filter_animals = parse_detect_json(data)
         
         if not image_data:
             return jsonify({'error': 'No image provided'}), 400
-        
-        results = {}
-        
-        if model_choice == 'yolov8n':
-            model = models['yolov8n']
-            if not model:
-                return jsonify({'error': 'YOLOv8n model not available'}), 500
-            
-            ann_img, detections, inf_time = run_detection(
-                model, image_data, confidence, iou, filter_animals
-            )
-            
-            results['yolov8n'] = {
-                'detections': detections,
-                'inference_time': round(inf_time, 2),
-                'image': encode_image_to_base64(ann_img) if ann_img else None,
-                'object_count': len(detections),
-                'avg_confidence': round(
-                    sum(d['confidence'] for d in detections) / len(detections), 4
-                ) if detections else 0
-            }
-        
-        elif model_choice == 'best':
-            model = models['best']
-            if not model:
-                return jsonify({'error': 'best.pt model not available'}), 500
-            
-            ann_img, detections, inf_time = run_detection(
-                model, image_data, confidence, iou, filter_animals
-            )
-            
-            results['best'] = {
-                'detections': detections,
-                'inference_time': round(inf_time, 2),
-                'image': encode_image_to_base64(ann_img) if ann_img else None,
-                'object_count': len(detections),
-                'avg_confidence': round(
-                    sum(d['confidence'] for d in detections) / len(detections), 4
-                ) if detections else 0
-            }
-        
-        elif model_choice == 'compare':
-            # Run both models
-            model1 = models['yolov8n']
-            model2 = models['best']
-            
-            if not model1:
-                return jsonify({'error': 'YOLOv8n model not available'}), 500
-            if not model2:
-                return jsonify({'error': 'best.pt model not available'}), 500
-            
-            ann_img1, det1, time1 = run_detection(
-                model1, image_data, confidence, iou, filter_animals
-            )
-            ann_img2, det2, time2 = run_detection(
-                model2, image_data, confidence, iou, filter_animals
-            )
-            
-            results['yolov8n'] = {
-                'detections': det1,
-                'inference_time': round(time1, 2),
-                'image': encode_image_to_base64(ann_img1) if ann_img1 else None,
-                'object_count': len(det1),
-                'avg_confidence': round(
-                    sum(d['confidence'] for d in det1) / len(det1), 4
-                ) if det1 else 0
-            }
-            
-            results['best'] = {
-                'detections': det2,
-                'inference_time': round(time2, 2),
-                'image': encode_image_to_base64(ann_img2) if ann_img2 else None,
-                'object_count': len(det2),
-                'avg_confidence': round(
-                    sum(d['confidence'] for d in det2) / len(det2), 4
-                ) if det2 else 0
-            }
-        
-        return jsonify({
-            'success': True,
-            'results': results,
-            'timestamp': datetime.now().isoformat()
-        }), 200
-    
+
+        inline_image = is_flag_set(data.get('inline_image'))
+        store_result = is_flag_set(data.get('store_result', True))
+        roi_profile, error = request_roi_profile(data.get('camera_id'))
+        if error:
+            payload, status = error
+            return jsonify(payload), status
+        profile = maybe_profile(
+            is_flag_set(data.get('profile')), request.headers.get('X-Admin-Token'), '/api/detect'
+        )
+        img_np, scale = profiled(profile, 'decode', decode_upload, image_data, roi_profile)
+        payload, status = detection_payload(
+            img_np, model_choice, confidence, iou, filter_animals, profile, scale,
+            inline_image, roi_profile, store_result
+        )
+        return jsonify(payload), status
+
+    except ImageTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+
     except Exception as e:
         print(f"Error in /api/detect: {e}")
         return jsonify({'error': str(e)}), 500
@@ -272,20 +100,8 @@ def detect():
 @app.route('/api/models', methods=['GET'])
 def get_models_info():
     """Get available models info"""
-    return jsonify({
-        'models': {
-            'yolov8n': {
-                'available': models['yolov8n'] is not None,
-                'type': 'YOLOv8 Nano',
-                'description': 'Lightweight general object detection'
-            },
-            'best': {
-                'available': models['best'] is not None,
-                'type': 'Custom Model',
-                'description': 'Custom-trained animal detection model'
-            }
-        }
-    }), 200
+    payload, status = models_payload()
+    return jsonify(payload), status
 
 @app.route('/api/detect-file', methods=['POST'])
 def detect_file():
@@ -297,53 +113,110 @@ def detect_file():
             return jsonify({'error': 'No file provided'}), 400
         
         file = request.files['file']
-        model_choice = request.form.get('model', 'yolov8n')
-        confidence = float(request.form.get('confidence', 0.4))
-        iou = float(request.form.get('iou', 0.5))
-        filter_animals = request.form.get('filter_animals', 'false').lower() == 'true'
+        model_choice, confidence, iou, filter_animals = parse_detect_form(request.form)
         
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
-        # Process file
-        image = Image.open(file.stream)
-        
-        # Convert to base64 for consistency
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        image_base64 = base64.b64encode(buffered.getvalue()).decode()
-        image_data = f"data:image/png;base64,{image_base64}"
-        
-        # Call detection
-        data = {
-            'image': image_data,
-            'model': model_choice,
-            'confidence': confidence,
-            'iou': iou,
-            'filter_animals': filter_animals
-        }
-        
-        with app.test_request_context(json=data):
-            return detect()
+        inline_image = is_flag_set(request.form.get('inline_image'))
+        store_result = is_flag_set(request.form.get('store_result', 'true'))
+        roi_profile, error = request_roi_profile(request.form.get('camera_id'))
+        if error:
+            payload, status = error
+            return jsonify(payload), status
+        profile = maybe_profile(
+            is_flag_set(request.form.get('profile')), request.headers.get('X-Admin-Token'), '/api/detect-file'
+        )
+        # Decode straight from the upload stream
+        img_np, scale = profiled(profile, 'decode', decode_upload, file.stream, roi_profile)
+        payload, status = detection_payload(
+            img_np, model_choice, confidence, iou, filter_animals, profile, scale,
+            inline_image, roi_profile, store_result
+        )
+        return jsonify(payload), status
+
+    except ImageTooLarge as e:
+        return jsonify({'error': str(e)}), 413
 
-    
     except Exception as e:
         print(f"Error in /api/detect-file: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/results/<result_id>/image', methods=['GET'])
+def get_result_image(result_id):
+    """
+    Annotated image for a detect result, rendered on first request and cached
+    Query: model, size (max long side in px), format (png | jpeg | webp)
+    """
+    rendered, error = result_image(
+        result_id, request.args.get('model'), request.args.get('size', type=int),
+        request.args.get('format', 'png').lower()
+    )
+    if error:
+        payload, status = error
+        return jsonify(payload), status
+    image_bytes, mimetype = rendered
+    return Response(image_bytes, mimetype=mimetype, headers={'Cache-Control': 'private, max-age=600'})
+
+@app.route('/api/cameras', methods=['GET'])
+def get_cameras():
+    """List camera ROI profiles"""
+    payload, status = cameras_payload()
+    return jsonify(payload), status
+
+@app.route('/api/cameras/<camera_id>/roi', methods=['GET', 'PUT', 'DELETE'])
+def camera_roi(camera_id):
+    """
+    Camera region of interest, coordinates are fractions (0-1) of the frame
+    PUT JSON:
+    {
+        "include": [{"rect": [x1, y1, x2, y2]} | {"polygon": [[x, y], ...]}],
+        "exclude": [...same shapes...]
+    }
+    """
+    admin_token = request.headers.get('X-Admin-Token')
+    if request.method == 'PUT':
+        payload, status = set_camera_roi_payload(camera_id, request.get_json(silent=True), admin_token)
+    elif request.method == 'DELETE':
+        payload, status = delete_camera_roi_payload(camera_id, admin_token)
+    else:
+        payload, status = camera_roi_payload(camera_id)
+    return jsonify(payload), status
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Decode counters: time spent and memory saved by reduced decoding"""
+    payload, status = metrics_payload()
+    return jsonify(payload), status
+
+@app.route('/api/profiles', methods=['GET'])
+def get_profiles():
+    """List saved request profiles (admin)"""
+    payload, status = profiles_payload(request.headers.get('X-Admin-Token'))
+    return jsonify(payload), status
+
+@app.route('/api/profiles/summary', methods=['GET'])
+def get_profiles_summary():
+    """Hottest functions and mean stage times across saved profiles (admin)"""
+    payload, status = profiles_summary_payload(
+        request.headers.get('X-Admin-Token'), request.args.get('limit', 20, type=int)
+    )
+    return jsonify(payload), status
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    """Download a cProfile trace, open with pstats or snakeviz (admin)"""
+    if not is_admin(request.headers.get('X-Admin-Token')):
+        return jsonify({'error': 'Admin token required'}), 403
+    path = profile_path(profile_id)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(path, as_attachment=True, mimetype='application/octet-stream')
+
 @app.route('/', methods=['GET'])
 def index():
     """Root endpoint"""
-    return jsonify({
-        'app': 'WildSnap API',
-        'version': '1.0.0',
-        'endpoints': {
-            '/api/health': 'Health check',
-            '/api/detect': 'POST - Detect animals in base64 image',
-            '/api/detect-file': 'POST - Detect animals in uploaded file',
-            '/api/models': 'GET - List available models'
-        }
-    }), 200
+    return jsonify(API_INFO), 200
 
 # --- ERROR HANDLERS ---
 
@@ -0,0 +1,154 @@
+"""
+Image decoding for WildSnap
+Reduced-resolution decoding of uploads and camera files, kept free of torch
+and ultralytics so decode-only processes (ingest.py workers) start quickly.
+detection.py re-exports everything here.
+"""
+
+from PIL import Image, ImageOps
+import numpy as np
+import base64
+import io
+import os
+import time
+import threading
+
+
+# --- DECODING ---
+# Long side the model letterboxes to; decoding beyond it only costs memory
+INFERENCE_SIZE = int(os.environ.get("WILDSNAP_INFERENCE_SIZE", 640))
+# Images still above this many pixels after reduced decode are rejected
+MAX_DECODE_PIXELS = int(os.environ.get("WILDSNAP_MAX_DECODE_PIXELS", 50_000_000))
+
+# Size is checked against MAX_DECODE_PIXELS before any pixels are loaded,
+# which lets large JPEGs through to the reduced-resolution path
+Image.MAX_IMAGE_PIXELS = None
+
+EXIF_ORIENTATION = 0x0112
+
+class ImageTooLarge(ValueError):
+    """Raised when an image exceeds MAX_DECODE_PIXELS and cannot be reduced"""
+
+decode_metrics = {
+    'images': 0,
+    'reduced': 0,
+    'rejected': 0,
+    'decode_ms_total': 0.0,
+    'pixels_decoded': 0,
+    'pixels_skipped': 0,
+    'bytes_saved_total': 0,
+    'bytes_saved_max': 0
+}
+_metrics_lock = threading.Lock()
+
+def _open_image(image_data):
+    """Open a base64 data URL, raw bytes or file-like object (header only)"""
+    if isinstance(image_data, str):
+        if image_data.startswith('data:image'):
+            # Remove data URL prefix
+            image_data = image_data.split(',')[1]
+        return Image.open(io.BytesIO(base64.b64decode(image_data)))
+    if isinstance(image_data, (bytes, bytearray)):
+        return Image.open(io.BytesIO(image_data))
+    return Image.open(image_data)
+
+def _draft_scale(width, height, target_size, region_size=None):
+    """
+    JPEG DCT scale (1, 2, 4 or 8) for a reduced decode: as large as possible
+    while the long side of region_size (default the whole image) stays
+    >= target_size, raised further if needed to fit MAX_DECODE_PIXELS
+    """
+    region_long = max(region_size or (width, height))
+    scale = 1
+    if target_size:
+        while scale < 8 and region_long // (scale * 2) >= target_size:
+            scale *= 2
+    while scale < 8 and (width // scale) * (height // scale) > MAX_DECODE_PIXELS:
+        scale *= 2
+    return scale
+
+def decode_image(image_data, target_size=INFERENCE_SIZE, region=None):
+    """
+    Decode an image for inference, at reduced resolution where the format allows
+    JPEGs are decoded at 1/2, 1/4 or 1/8 scale when the model would downscale
+    anyway; EXIF orientation is applied. region (x1, y1, x2, y2, as fractions
+    of the oriented image) is the part that will be cropped for inference and
+    must keep target_size
+    Returns: RGB uint8 numpy array (H, W, 3), (scale_x, scale_y) of the array
+    relative to the (oriented) original, for mapping boxes back
+    """
+    start_time = time.time()
+    image = _open_image(image_data)
+    orig_w, orig_h = image.size
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+
+    # Phone and camera JPEGs with an MPF marker open as MPO, which drafts the same way
+    if image.format in ('JPEG', 'MPO'):
+        region_size = None
+        if region is not None:
+            oriented_w, oriented_h = (orig_h, orig_w) if orientation in (5, 6, 7, 8) else (orig_w, orig_h)
+            region_size = (
+                (region[2] - region[0]) * oriented_w,
+                (region[3] - region[1]) * oriented_h
+            )
+        scale = _draft_scale(orig_w, orig_h, target_size, region_size)
+        if scale > 1:
+            image.draft('RGB', (orig_w // scale, orig_h // scale))
+
+    width, height = image.size
+    if width * height > MAX_DECODE_PIXELS:
+        with _metrics_lock:
+            decode_metrics['rejected'] += 1
+        raise ImageTooLarge(
+            f"Image is {orig_w}x{orig_h}, above the {MAX_DECODE_PIXELS} pixel limit"
+        )
+
+    if orientation != 1:
+        image = ImageOps.exif_transpose(image)
+    if orientation in (5, 6, 7, 8):
+        orig_w, orig_h = orig_h, orig_w
+
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    img_np = np.asarray(image)
+
+    decoded_h, decoded_w = img_np.shape[:2]
+    pixels_skipped = orig_w * orig_h - decoded_w * decoded_h
+    with _metrics_lock:
+        decode_metrics['images'] += 1
+        decode_metrics['reduced'] += 1 if pixels_skipped > 0 else 0
+        decode_metrics['decode_ms_total'] += (time.time() - start_time) * 1000
+        decode_metrics['pixels_decoded'] += decoded_w * decoded_h
+        decode_metrics['pixels_skipped'] += pixels_skipped
+        decode_metrics['bytes_saved_total'] += pixels_skipped * 3
+        decode_metrics['bytes_saved_max'] = max(
+            decode_metrics['bytes_saved_max'], pixels_skipped * 3
+        )
+
+    return img_np, (decoded_w / orig_w, decoded_h / orig_h)
+
+def decode_metrics_snapshot():
+    """Decode counters plus derived averages, for /api/metrics"""
+    with _metrics_lock:
+        snapshot = dict(decode_metrics)
+    images = snapshot['images']
+    snapshot['decode_ms_total'] = round(snapshot['decode_ms_total'], 2)
+    snapshot['decode_ms_avg'] = round(snapshot['decode_ms_total'] / images, 2) if images else 0
+    snapshot['max_decode_pixels'] = MAX_DECODE_PIXELS
+    snapshot['inference_size'] = INFERENCE_SIZE
+    return snapshot
+
+def scale_detections(detections, scale):
+    """Map detections from decoded-frame to original image coordinates"""
+    scale_x, scale_y = scale
+    if scale_x == 1 and scale_y == 1:
+        return detections
+
+    for d in detections:
+        x1, y1, x2, y2 = d['bbox']
+        x1, x2 = int(x1 / scale_x), int(x2 / scale_x)
+        y1, y2 = int(y1 / scale_y), int(y2 / scale_y)
+        d['bbox'] = [x1, y1, x2, y2]
+        d['width'] = x2 - x1
+        d['height'] = y2 - y1
+    return detections
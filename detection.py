@@ -0,0 +1,215 @@
+"""
+Detection core for WildSnap
+Model loading and YOLOv8 inference shared by the API servers; decoding
+lives in decoding.py and is re-exported here
+"""
+
+from ultralytics import YOLO
+from PIL import Image
+import numpy as np
+import base64
+import io
+import time
+import torch
+from ultralytics.nn.tasks import DetectionModel
+from ultralytics.utils.plotting import Annotator, colors
+from torch.nn import Sequential
+from decoding import (
+    decode_image, decode_metrics_snapshot, scale_detections, ImageTooLarge,
+    INFERENCE_SIZE, MAX_DECODE_PIXELS
+)
+
+
+# --- MODEL LOADING ---
+MODEL_FILES = {
+    'yolov8n': "yolov8n.pt",
+    'best': "best.pt"
+}
+
+ANIMAL_CLASSES = {
+    'bird', 'cat', 'dog', 'horse', 'sheep', 'cow',
+    'elephant', 'bear', 'zebra', 'giraffe', 'person'
+}
+
+models = {}
+
+def load_models():
+    """Load YOLOv8 models at startup"""
+    # Add the required model classes to the list of safe globals
+    torch.serialization.add_safe_globals([DetectionModel, Sequential])
+    try:
+        print("Loading YOLOv8n model...")
+        models['yolov8n'] = YOLO(MODEL_FILES['yolov8n'])
+        print("✓ YOLOv8n loaded successfully")
+    except Exception as e:
+        print(f"✗ Error loading yolov8n: {e}")
+        models['yolov8n'] = None
+
+    try:
+        print("Loading best.pt model...")
+        models['best'] = YOLO(MODEL_FILES['best'])
+        print("✓ best.pt loaded successfully")
+    except Exception as e:
+        print(f"⚠ Warning: best.pt not found: {e}")
+        models['best'] = None
+
+# --- HELPER FUNCTIONS ---
+
+IMAGE_FORMATS = {
+    'png': ("PNG", "image/png"),
+    'jpeg': ("JPEG", "image/jpeg"),
+    'webp': ("WEBP", "image/webp")
+}
+
+def encode_image(image_pil, fmt='png', quality=90):
+    """
+    Encode a PIL image as png, jpeg or webp
+    Returns: image bytes, mimetype
+    """
+    pil_format, mimetype = IMAGE_FORMATS[fmt]
+    buffered = io.BytesIO()
+    if pil_format == "PNG":
+        image_pil.save(buffered, format=pil_format)
+    else:
+        image_pil.save(buffered, format=pil_format, quality=quality)
+    return buffered.getvalue(), mimetype
+
+def encode_image_to_base64(image_pil):
+    """Convert PIL image to base64 string"""
+    image_bytes, mimetype = encode_image(image_pil, 'png')
+    img_str = base64.b64encode(image_bytes).decode()
+    return f"data:{mimetype};base64,{img_str}"
+
+# --- INFERENCE ---
+
+def extract_detections(results, names, filter_animals=False):
+    """Convert YOLO results into the JSON detection format"""
+    detections = []
+
+    for r in results:
+        for box in r.boxes:
+            cls_id = int(box.cls.item())
+            class_name = names.get(cls_id, str(cls_id))
+
+            if filter_animals and class_name.lower() not in ANIMAL_CLASSES:
+                continue
+
+            xyxy = box.xyxy[0].tolist()
+            x1, y1, x2, y2 = map(int, xyxy)
+            conf = float(box.conf.item())
+
+            detections.append({
+                "class": class_name,
+                "class_id": cls_id,
+                "confidence": round(conf, 4),
+                "bbox": [x1, y1, x2, y2],
+                "width": x2 - x1,
+                "height": y2 - y1
+            })
+
+    return detections
+
+def run_detection(model_key, img_np, conf_threshold, iou_threshold, filter_animals=False,
+                  timings=None, render=True):
+    """
+    Run YOLO detection on a decoded RGB frame
+    If a timings dict is given, per-stage times (ms) are recorded into it
+    With render=False the annotated frame is skipped (see render_detections)
+    Returns: annotated_frame (RGB numpy array) or None, detections, inference_time
+    """
+    model = models.get(model_key)
+    if model is None:
+        return None, [], 0
+
+    try:
+        # Run inference
+        start_time = time.time()
+        results = model.predict(
+            source=img_np,
+            conf=conf_threshold,
+            iou=iou_threshold,
+            verbose=False
+        )
+        inference_time = (time.time() - start_time) * 1000  # milliseconds
+
+        # Create annotated image
+        annotated_rgb = None
+        plot_start = time.time()
+        if render:
+            annotated_bgr = results[0].plot()
+            annotated_rgb = annotated_bgr[..., ::-1]
+
+        if timings is not None:
+            speed = results[0].speed
+            timings['preprocess'] = round(speed.get('preprocess') or 0, 2)
+            timings['forward'] = round(speed.get('inference') or 0, 2)
+            timings['nms'] = round(speed.get('postprocess') or 0, 2)
+            if render:
+                timings['plot'] = round((time.time() - plot_start) * 1000, 2)
+
+        # Filter animals if requested (only for yolov8n)
+        detections = extract_detections(
+            results, model.names, filter_animals and model_key == 'yolov8n'
+        )
+
+        return annotated_rgb, detections, inference_time
+
+    except Exception as e:
+        print(f"Error in detection: {e}")
+        return None, [], 0
+
+def run_detection_batch(model_key, frames, conf_threshold, iou_threshold, filter_animals=False):
+    """
+    Run YOLO detection on a batch of decoded RGB frames, without annotation
+    Returns: detections per frame, inference_time for the whole batch
+    """
+    model = models.get(model_key)
+    if model is None:
+        return [[] for _ in frames], 0
+
+    start_time = time.time()
+    results = model.predict(
+        source=list(frames),
+        conf=conf_threshold,
+        iou=iou_threshold,
+        verbose=False
+    )
+    inference_time = (time.time() - start_time) * 1000  # milliseconds
+
+    filter_animals = filter_animals and model_key == 'yolov8n'
+    return [extract_detections([r], model.names, filter_animals) for r in results], inference_time
+
+def render_detections(img_np, detections, scale=(1, 1)):
+    """
+    Draw detections on a decoded RGB frame, matching results.plot() styling
+    Detections are in original image coordinates, as returned by the API
+    Returns: annotated RGB numpy array
+    """
+    scale_x, scale_y = scale
+    annotator = Annotator(np.array(img_np), example="".join(d['class'] for d in detections))
+    for d in detections:
+        x1, y1, x2, y2 = d['bbox']
+        annotator.box_label(
+            [x1 * scale_x, y1 * scale_y, x2 * scale_x, y2 * scale_y],
+            f"{d['class']} {d['confidence']:.2f}",
+            color=colors(d.get('class_id', 0), False)
+        )
+    return annotator.result()
+
+def build_result(annotated_frame, detections, inference_time, timings=None):
+    """Build the per-model JSON result returned by /api/detect"""
+    encode_start = time.time()
+    image = encode_image_to_base64(Image.fromarray(annotated_frame)) \
+        if annotated_frame is not None else None
+    if timings is not None:
+        timings['encode'] = round((time.time() - encode_start) * 1000, 2)
+
+    return {
+        'detections': detections,
+        'inference_time': round(inference_time, 2),
+        'image': image,
+        'object_count': len(detections),
+        'avg_confidence': round(
+            sum(d['confidence'] for d in detections) / len(detections), 4
+        ) if detections else 0
+    }
@@ -0,0 +1,244 @@
+"""
+Inference process pool for WildSnap
+Runs YOLOv8 in dedicated worker processes so request threads only handle I/O.
+Frames are passed through shared memory and annotated in place; only the
+detections and timings travel back through the pipe.
+"""
+
+import cProfile
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import queue
+import threading
+import numpy as np
+
+
+# Delay before retrying a worker that failed to restart, doubling up to the max
+RESTART_BACKOFF = 5
+RESTART_BACKOFF_MAX = 300
+
+
+class WorkerCrashed(RuntimeError):
+    """Raised when an inference worker dies while handling a job"""
+
+
+# --- WORKER PROCESS ---
+
+def _worker_main(conn):
+    """Worker entry point: load models once, then serve jobs from the pipe"""
+    import detection
+
+    detection.load_models()
+    conn.send({
+        'ready': True,
+        'models_loaded': {k: m is not None for k, m in detection.models.items()}
+    })
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+
+        shm = shared_memory.SharedMemory(name=job['shm_name'])
+        profiler = cProfile.Profile() if job.get('profile') else None
+        try:
+            frame = np.ndarray(job['shape'], dtype=np.uint8, buffer=shm.buf)
+            timings = {}
+            if profiler is not None:
+                profiler.enable()
+            annotated, detections, inf_time = detection.run_detection(
+                job['model'], frame, job['confidence'], job['iou'],
+                job['filter_animals'], timings, job['render']
+            )
+            if profiler is not None:
+                profiler.disable()
+                profiler.create_stats()
+            # Annotated frame has the input's shape, write it back in place
+            if annotated is not None:
+                frame[...] = annotated
+            del frame
+            conn.send({
+                'detections': detections,
+                'inference_time': inf_time,
+                'annotated': annotated is not None,
+                'timings': timings,
+                'profile_stats': profiler.stats if profiler is not None else None
+            })
+        finally:
+            shm.close()
+
+
+# --- POOL ---
+
+class _Worker:
+    def __init__(self, ctx, index):
+        self.index = index
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn,),
+            name=f"wildsnap-inference-{index}",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.models_loaded = None
+
+    def wait_ready(self, timeout):
+        if not self.conn.poll(timeout):
+            raise WorkerCrashed(f"Inference worker {self.index} did not start")
+        try:
+            self.models_loaded = self.conn.recv()['models_loaded']
+        except EOFError:
+            raise WorkerCrashed(f"Inference worker {self.index} exited during startup")
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class InferencePool:
+    """
+    Fixed-size pool of inference processes.
+    Each worker owns a pipe, so a crash is attributed to exactly one job;
+    the caller gets WorkerCrashed straight away and the slot is restarted in
+    the background, retrying with backoff until the worker is back.
+    job_timeout bounds both the wait for a free worker and the job itself.
+    """
+
+    def __init__(self, size, job_timeout=60, start_timeout=300):
+        self.size = size
+        self.job_timeout = job_timeout
+        self.start_timeout = start_timeout
+        # spawn avoids forking a parent that already holds torch threads
+        self._ctx = mp.get_context("spawn")
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._models_loaded = {}
+        self._stopping = threading.Event()
+
+    def start(self):
+        # Spawn every worker before waiting, so the models load in parallel
+        workers = [_Worker(self._ctx, i) for i in range(self.size)]
+        try:
+            for worker in workers:
+                worker.wait_ready(self.start_timeout)
+        except WorkerCrashed:
+            for worker in workers:
+                worker.stop()
+            raise
+        for worker in workers:
+            self._workers.append(worker)
+            self._idle.put(worker)
+        self._models_loaded = self._workers[0].models_loaded if self._workers else {}
+        print(f"✓ Inference pool started with {self.size} worker(s)")
+
+    def models_loaded(self):
+        # Reported from startup, so a slot that is restarting doesn't hide the models
+        return self._models_loaded
+
+    def _discard(self, worker):
+        """Take a crashed worker out of the pool and restart its slot in the background"""
+        print(f"✗ Inference worker {worker.index} crashed, restarting")
+        with self._lock:
+            self._workers.remove(worker)
+        threading.Thread(
+            target=self._restart,
+            args=(worker,),
+            name=f"wildsnap-restart-{worker.index}",
+            daemon=True
+        ).start()
+
+    def _restart(self, old_worker):
+        old_worker.stop()
+        delay = RESTART_BACKOFF
+        while not self._stopping.is_set():
+            worker = _Worker(self._ctx, old_worker.index)
+            try:
+                worker.wait_ready(self.start_timeout)
+            except WorkerCrashed:
+                worker.stop()
+                print(f"✗ Inference worker {old_worker.index} failed to restart, retrying in {delay}s")
+                self._stopping.wait(delay)
+                delay = min(delay * 2, RESTART_BACKOFF_MAX)
+                continue
+
+            with self._lock:
+                if self._stopping.is_set():
+                    worker.stop()
+                    return
+                self._workers.append(worker)
+            self._idle.put(worker)
+            print(f"✓ Inference worker {old_worker.index} restarted")
+            return
+
+    def run_detection(self, model_key, img_np, conf_threshold, iou_threshold,
+                      filter_animals=False, timings=None, render=True, profile=None):
+        """
+        Same contract as detection.run_detection, executed in a worker.
+        With a profiling.RequestProfile, the worker's cProfile stats are merged into it
+        Returns: annotated_frame, detections, inference_time
+        """
+        if not self._workers:
+            raise WorkerCrashed("All inference workers are restarting")
+        try:
+            worker = self._idle.get(timeout=self.job_timeout)
+        except queue.Empty:
+            raise WorkerCrashed("No inference worker available")
+
+        img_np = np.ascontiguousarray(img_np, dtype=np.uint8)
+        shm = shared_memory.SharedMemory(create=True, size=max(img_np.nbytes, 1))
+        try:
+            frame = np.ndarray(img_np.shape, dtype=np.uint8, buffer=shm.buf)
+            frame[...] = img_np
+
+            try:
+                worker.conn.send({
+                    'shm_name': shm.name,
+                    'shape': img_np.shape,
+                    'model': model_key,
+                    'confidence': conf_threshold,
+                    'iou': iou_threshold,
+                    'filter_animals': filter_animals,
+                    'profile': profile is not None,
+                    'render': render
+                })
+                if not worker.conn.poll(self.job_timeout):
+                    raise WorkerCrashed("Inference worker timed out")
+                reply = worker.conn.recv()
+            except (EOFError, BrokenPipeError, OSError, WorkerCrashed) as e:
+                del frame
+                self._discard(worker)
+                worker = None
+                raise WorkerCrashed(str(e) or "Inference worker crashed")
+
+            if timings is not None:
+                timings.update(reply['timings'])
+            if profile is not None:
+                profile.add_worker_stats(reply['profile_stats'])
+
+            annotated = frame.copy() if reply['annotated'] else None
+            del frame
+            return annotated, reply['detections'], reply['inference_time']
+        finally:
+            if worker is not None:
+                self._idle.put(worker)
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self):
+        self._stopping.set()
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
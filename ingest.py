@@ -0,0 +1,396 @@
+"""
+Offline folder ingestion for WildSnap
+Walks a directory of camera images, decodes them in a process pool and runs
+batched YOLOv8 inference, writing CSV, JSONL or COCO JSON.
+
+Progress is recorded in a manifest (JSONL) next to the output, so an
+interrupted run picks up where it stopped (images that failed to decode
+are tried again):
+
+    python ingest.py /media/sdcard -o results.csv
+    python ingest.py /media/sdcard -o results.json --format coco --model compare
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import roi
+
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff'}
+
+CSV_FIELDS = [
+    'file', 'model', 'class', 'class_id', 'confidence',
+    'x1', 'y1', 'x2', 'y2', 'width', 'height'
+]
+
+
+# --- DISCOVERY ---
+
+def find_images(root):
+    """Image paths under root, relative to it, in a stable order"""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                paths.append(os.path.relpath(os.path.join(dirpath, name), root))
+    return paths
+
+
+# --- DECODE WORKERS ---
+
+def _decode_file(root, rel_path, region):
+    """
+    Decode one image in a pool process
+    Returns: rel_path, frame or None, scale, error message or None
+    """
+    from decoding import decode_image
+
+    try:
+        with open(os.path.join(root, rel_path), 'rb') as f:
+            img_np, scale = decode_image(f.read(), region=region)
+        return rel_path, img_np, scale, None
+    except Exception as e:
+        return rel_path, None, None, f"{type(e).__name__}: {e}"
+
+
+def prefetch_decoded(root, paths, workers, prefetch, region=None):
+    """Yield decoded images in order, keeping at most `prefetch` decodes in flight"""
+    ctx = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        pending = deque()
+        path_iter = iter(paths)
+        for rel_path in path_iter:
+            pending.append(pool.submit(_decode_file, root, rel_path, region))
+            if len(pending) >= prefetch:
+                break
+        while pending:
+            yield pending.popleft().result()
+            next_path = next(path_iter, None)
+            if next_path is not None:
+                pending.append(pool.submit(_decode_file, root, next_path, region))
+
+
+# --- MANIFEST ---
+
+def run_settings(args, roi_profile):
+    """
+    Settings that change the results; a manifest only resumes with the same ones.
+    The source path is left out so a card remounted elsewhere still resumes
+    """
+    return {
+        'model': args.model,
+        'confidence': args.confidence,
+        'iou': args.iou,
+        'filter_animals': args.filter_animals,
+        'camera': args.camera,
+        'roi': roi_profile
+    }
+
+
+def load_manifest(path):
+    """
+    Read a manifest written by a previous run
+    Returns: run settings (or None), records in processing order
+    """
+    settings, records = None, []
+    if not os.path.exists(path):
+        return settings, records
+
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A torn last line from an interrupted write
+                continue
+            if 'run' in entry:
+                settings = entry['run']
+            else:
+                records.append(entry)
+    return settings, records
+
+
+# --- OUTPUT ---
+
+class CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=CSV_FIELDS)
+        self.writer.writeheader()
+
+    def write(self, record):
+        for model_key, detections in record.get('results', {}).items():
+            for d in detections:
+                x1, y1, x2, y2 = d['bbox']
+                self.writer.writerow({
+                    'file': record['file'],
+                    'model': model_key,
+                    'class': d['class'],
+                    'class_id': d.get('class_id'),
+                    'confidence': d['confidence'],
+                    'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2,
+                    'width': d['width'],
+                    'height': d['height']
+                })
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self, records):
+        self.file.close()
+
+
+class JsonlWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w')
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self, records):
+        self.file.close()
+
+
+class CocoWriter:
+    """COCO is a single document, so it is built from the manifest at the end"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, record):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self, records):
+        images, annotations, categories = [], [], {}
+        for image_id, record in enumerate(r for r in records if 'error' not in r):
+            width, height = record['size']
+            images.append({
+                'id': image_id + 1,
+                'file_name': record['file'],
+                'width': width,
+                'height': height
+            })
+            for model_key, detections in record['results'].items():
+                for d in detections:
+                    category_id = categories.setdefault(d['class'], len(categories) + 1)
+                    x1, y1 = d['bbox'][:2]
+                    annotations.append({
+                        'id': len(annotations) + 1,
+                        'image_id': image_id + 1,
+                        'category_id': category_id,
+                        'bbox': [x1, y1, d['width'], d['height']],
+                        'area': d['width'] * d['height'],
+                        'score': d['confidence'],
+                        'iscrowd': 0,
+                        'model': model_key
+                    })
+
+        with open(self.path, 'w') as f:
+            json.dump({
+                'images': images,
+                'annotations': annotations,
+                'categories': [{'id': i, 'name': n} for n, i in categories.items()]
+            }, f)
+
+
+WRITERS = {
+    'csv': CsvWriter,
+    'jsonl': JsonlWriter,
+    'coco': CocoWriter
+}
+
+
+# --- INGESTION ---
+
+def process_batch(batch, model_keys, args, roi_profile=None):
+    """
+    Run every model on a batch of decoded images
+    Returns: manifest records, one per image
+    """
+    from detection import run_detection_batch, scale_detections
+
+    crops = [roi.crop_frame(img_np, roi_profile) for _, img_np, _ in batch]
+    frames = [frame for frame, _ in crops]
+    records = [{
+        'file': rel_path,
+        'size': [round(img_np.shape[1] / scale[0]), round(img_np.shape[0] / scale[1])],
+        'results': {}
+    } for rel_path, img_np, scale in batch]
+
+    for key in model_keys:
+        detections_per_frame, _ = run_detection_batch(
+            key, frames, args.confidence, args.iou, args.filter_animals
+        )
+        for record, (_, _, scale), (_, offset), detections in zip(
+            records, batch, crops, detections_per_frame
+        ):
+            detections = scale_detections(roi.offset_detections(detections, offset), scale)
+            record['results'][key] = roi.drop_excluded(detections, roi_profile, record['size'])
+    return records
+
+
+def ingest(args):
+    from detection import load_models, models
+
+    output_format = args.format or (
+        'jsonl' if args.output.endswith('.jsonl')
+        else 'coco' if args.output.endswith('.json')
+        else 'csv'
+    )
+    manifest_path = args.manifest or f"{args.output}.manifest.jsonl"
+    roi_profile = None
+    if args.camera:
+        roi_profile = roi.get_profile(args.camera)
+        if roi_profile is None:
+            print(f"✗ No ROI profile for camera '{args.camera}' in {roi.ROI_FILE}")
+            return 1
+    settings = run_settings(args, roi_profile)
+
+    if args.restart and os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    previous_settings, records = load_manifest(manifest_path)
+    if previous_settings is not None:
+        # Manifests from before the source path was dropped from the settings
+        previous_settings.pop('source', None)
+    if previous_settings is not None and previous_settings != settings:
+        print(f"✗ {manifest_path} was written with different settings:")
+        print(f"  {json.dumps(previous_settings)}")
+        print("  Use --restart to start over, or --manifest for a separate run.")
+        return 1
+
+    # Files that failed to decode (e.g. a flaky card read) are tried again
+    done_records = [r for r in records if 'error' not in r]
+    retried = len({r['file'] for r in records if 'error' in r} - {r['file'] for r in done_records})
+
+    paths = find_images(args.source)
+    done = {r['file'] for r in done_records}
+    todo = [p for p in paths if p not in done]
+    print(f"🐾 {len(paths)} images found, {len(done)} already processed, {len(todo)} to go"
+          + (f" ({retried} retrying after errors)" if retried else ""))
+
+    model_keys = ['yolov8n', 'best'] if args.model == 'compare' else [args.model]
+    if todo:
+        load_models()
+        for key in model_keys:
+            if models.get(key) is None:
+                print(f"✗ Model '{key}' is not available")
+                return 1
+
+    # Replay finished work so the output always matches the manifest
+    writer = WRITERS[output_format](args.output)
+    for record in done_records:
+        writer.write(record)
+
+    manifest = open(manifest_path, 'a')
+    if previous_settings is None:
+        manifest.write(json.dumps({'run': settings}) + "\n")
+
+    processed, errors, detections_total = 0, 0, 0
+    start_time = last_report = time.time()
+    batch = []
+
+    def flush_batch():
+        nonlocal detections_total
+        records = process_batch(batch, model_keys, args, roi_profile) if batch else []
+        for record in records:
+            detections_total += sum(len(d) for d in record['results'].values())
+        commit(records)
+        batch.clear()
+
+    def commit(records):
+        # Manifest first: on resume the output is rebuilt from it
+        for record in records:
+            manifest.write(json.dumps(record) + "\n")
+            done_records.append(record)
+        manifest.flush()
+        os.fsync(manifest.fileno())
+        for record in records:
+            writer.write(record)
+        writer.flush()
+
+    try:
+        for rel_path, img_np, scale, error in prefetch_decoded(
+            args.source, todo, args.workers, args.prefetch, roi.include_bounds(roi_profile)
+        ):
+            if error:
+                errors += 1
+                commit([{'file': rel_path, 'error': error}])
+            else:
+                batch.append((rel_path, img_np, scale))
+                if len(batch) >= args.batch_size:
+                    flush_batch()
+
+            processed += 1
+            now = time.time()
+            if now - last_report < 0.5 and processed < len(todo):
+                continue
+            last_report = now
+            elapsed = now - start_time
+            rate = processed / elapsed if elapsed > 0 else 0
+            remaining = (len(todo) - processed) / rate if rate > 0 else 0
+            sys.stdout.write(
+                f"\r  {processed}/{len(todo)} images | {rate:.1f} img/s | "
+                f"{detections_total} detections | {errors} errors | ETA {remaining:.0f}s  "
+            )
+            sys.stdout.flush()
+
+        flush_batch()
+    except KeyboardInterrupt:
+        print("\n⚠ Interrupted, progress saved; run the same command again to resume")
+        return 130
+    finally:
+        manifest.close()
+        writer.close(done_records)
+
+    elapsed = time.time() - start_time
+    print(f"\n✓ {processed} images in {elapsed:.1f}s, {detections_total} detections, "
+          f"{errors} errors -> {args.output}")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run WildSnap detection over a folder of images"
+    )
+    parser.add_argument('source', help="Directory to scan recursively for images")
+    parser.add_argument('-o', '--output', required=True, help="Output file")
+    parser.add_argument('--format', choices=sorted(WRITERS),
+                        help="Output format (default: from the output extension, else csv)")
+    parser.add_argument('--model', choices=['yolov8n', 'best', 'compare'], default='yolov8n')
+    parser.add_argument('--confidence', type=float, default=0.4)
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--filter-animals', action='store_true',
+                        help="Keep only animal classes (YOLOv8n only)")
+    parser.add_argument('--camera',
+                        help="Apply this camera's ROI profile (see /api/cameras)")
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Decode processes")
+    parser.add_argument('--prefetch', type=int, default=64,
+                        help="Maximum images decoded ahead of inference")
+    parser.add_argument('--manifest', help="Manifest path (default: <output>.manifest.jsonl)")
+    parser.add_argument('--restart', action='store_true',
+                        help="Ignore an existing manifest and process everything again")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(ingest(parse_args()))
@@ -0,0 +1,235 @@
+"""
+Request profiling for WildSnap
+Opt-in cProfile capture of single detection requests, either asked for by an
+admin ("profile": true plus X-Admin-Token) or sampled at a configured rate.
+Traces are kept in a bounded local directory as pstats dumps plus a JSON
+stage breakdown (decode, preprocess, forward, nms, plot, encode).
+"""
+
+import cProfile
+import pstats
+import random
+import json
+import os
+import re
+import time
+import uuid
+import hmac
+import threading
+from datetime import datetime
+
+
+# --- CONFIGURATION ---
+ADMIN_TOKEN = os.environ.get("WILDSNAP_ADMIN_TOKEN", "")
+PROFILE_DIR = os.environ.get("WILDSNAP_PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.environ.get("WILDSNAP_PROFILE_MAX_FILES", 50))
+PROFILE_SAMPLE_RATE = float(os.environ.get("WILDSNAP_PROFILE_SAMPLE_RATE", 0))
+
+PROFILE_ID_RE = re.compile(r'^[0-9T]+-[0-9a-f]{8}$')
+
+_save_lock = threading.Lock()
+# Only one profiler may be enabled at a time (interpreter-wide on Python 3.12+)
+_profiler_lock = threading.Lock()
+
+
+def is_admin(token):
+    """Check an X-Admin-Token header; admin actions are off without a configured token"""
+    if not ADMIN_TOKEN or not token:
+        return False
+    # Bytes, since compare_digest rejects non-ASCII str
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+class _StatsHolder:
+    """Lets pstats merge raw stats dicts sent back by inference workers"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class RequestProfile:
+    """cProfile trace and stage timings (ms) for one request"""
+
+    def __init__(self, endpoint):
+        self.id = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+        self.endpoint = endpoint
+        self.profiler = cProfile.Profile()
+        self.stages = {}
+        self.worker_stats = []
+        self.skipped_stages = []
+
+    def run(self, stage, func, *args, **kwargs):
+        """
+        Call func under the profiler, recording its time as `stage` if given
+        If another request is being profiled right now, func runs unprofiled
+        (its time is still recorded) rather than failing the request
+        """
+        start = time.perf_counter()
+        enabled = False
+        if _profiler_lock.acquire(blocking=False):
+            try:
+                self.profiler.enable()
+                enabled = True
+            except ValueError:
+                # Another profiling tool holds the interpreter's profiler
+                _profiler_lock.release()
+        if not enabled:
+            self.skipped_stages.append(stage or getattr(func, '__name__', 'call'))
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if enabled:
+                self.profiler.disable()
+                _profiler_lock.release()
+            if stage:
+                self.stages[stage] = round((time.perf_counter() - start) * 1000, 2)
+
+    def add_worker_stats(self, stats):
+        if stats:
+            self.worker_stats.append(stats)
+
+    def save(self):
+        """Write the trace and summary to PROFILE_DIR, return the profile id"""
+        # Empty when every stage ran unprofiled, which pstats refuses to load
+        self.profiler.create_stats()
+        stats = pstats.Stats()
+        for raw_stats in [self.profiler.stats] + self.worker_stats:
+            if raw_stats:
+                stats.add(_StatsHolder(raw_stats))
+
+        summary = {
+            'id': self.id,
+            'endpoint': self.endpoint,
+            'created': datetime.now().isoformat(),
+            'stages': self.stages,
+            'unprofiled_stages': self.skipped_stages,
+            'top_functions': hot_functions(stats, limit=15)
+        }
+
+        with _save_lock:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            stats.dump_stats(os.path.join(PROFILE_DIR, f"{self.id}.prof"))
+            with open(os.path.join(PROFILE_DIR, f"{self.id}.json"), 'w') as f:
+                json.dump(summary, f, indent=2)
+            _prune()
+
+        return self.id
+
+
+def maybe_profile(requested, admin_token, endpoint):
+    """
+    Start a RequestProfile if an admin asked for one or the request is sampled
+    Returns: RequestProfile or None
+    """
+    if requested and is_admin(admin_token):
+        return RequestProfile(endpoint)
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return RequestProfile(endpoint)
+    return None
+
+
+def profiled(profile, stage, func, *args, **kwargs):
+    """Call func, under `profile` when the request is being profiled"""
+    if profile is None:
+        return func(*args, **kwargs)
+    return profile.run(stage, func, *args, **kwargs)
+
+
+# --- STORAGE ---
+
+def _saved_ids():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    ids = [name[:-5] for name in os.listdir(PROFILE_DIR) if name.endswith('.prof')]
+    return sorted(i for i in ids if PROFILE_ID_RE.match(i))
+
+
+def _prune():
+    """Keep only the newest PROFILE_MAX_FILES traces"""
+    ids = _saved_ids()
+    for profile_id in ids[:max(0, len(ids) - PROFILE_MAX_FILES)]:
+        for ext in ('.prof', '.json'):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, profile_id + ext))
+            except FileNotFoundError:
+                pass
+
+
+def profile_path(profile_id):
+    """Path of a saved .prof trace, or None if the id is unknown"""
+    if not PROFILE_ID_RE.match(profile_id or ''):
+        return None
+    path = os.path.abspath(os.path.join(PROFILE_DIR, f"{profile_id}.prof"))
+    return path if os.path.isfile(path) else None
+
+
+def list_profiles():
+    profiles = []
+    for profile_id in reversed(_saved_ids()):
+        try:
+            with open(os.path.join(PROFILE_DIR, f"{profile_id}.json")) as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            continue
+        profiles.append({
+            'id': profile_id,
+            'endpoint': summary.get('endpoint'),
+            'created': summary.get('created'),
+            'stages': summary.get('stages', {})
+        })
+    return profiles
+
+
+def hot_functions(stats, limit=20):
+    """Top functions of a pstats.Stats by own (exclusive) time"""
+    rows = []
+    for (filename, line, func), (cc, nc, tt, ct, callers) in stats.stats.items():
+        rows.append({
+            'function': f"{os.path.basename(filename)}:{line}({func})",
+            'calls': nc,
+            'own_ms': round(tt * 1000, 3),
+            'cumulative_ms': round(ct * 1000, 3)
+        })
+    rows.sort(key=lambda r: r['own_ms'], reverse=True)
+    return rows[:limit]
+
+
+def profiles_summary(limit=20):
+    """Hottest functions and mean stage times across all saved traces"""
+    ids = _saved_ids()
+    if not ids:
+        return {'profile_count': 0, 'stages_avg_ms': {}, 'top_functions': []}
+
+    stats = pstats.Stats()
+    for profile_id in ids:
+        try:
+            stats.add(os.path.join(PROFILE_DIR, f"{profile_id}.prof"))
+        except TypeError:
+            # Trace with no profiled stages
+            continue
+
+    stage_totals = {}
+    for profile in list_profiles():
+        for stage, value in _flatten_stages(profile['stages']):
+            stage_totals.setdefault(stage, []).append(value)
+
+    return {
+        'profile_count': len(ids),
+        'stages_avg_ms': {
+            stage: round(sum(values) / len(values), 2)
+            for stage, values in stage_totals.items()
+        },
+        'top_functions': hot_functions(stats, limit)
+    }
+
+
+def _flatten_stages(stages, prefix=''):
+    """Yield ('model.stage', ms) pairs from nested per-model stage dicts"""
+    for name, value in stages.items():
+        if isinstance(value, dict):
+            yield from _flatten_stages(value, f"{prefix}{name}.")
+        else:
+            yield f"{prefix}{name}", value
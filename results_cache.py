@@ -0,0 +1,150 @@
+"""
+Result cache for WildSnap
+Keeps decoded frames and detections from recent /api/detect calls so the
+annotated image is only rendered when GET /api/results/<id>/image asks for it.
+Bounded by total bytes (frames plus rendered images) and by age.
+"""
+
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+from detection import render_detections, encode_image, IMAGE_FORMATS
+
+
+# --- CONFIGURATION ---
+RESULT_CACHE_MB = int(os.environ.get("WILDSNAP_RESULT_CACHE_MB", 64))
+RESULT_TTL = int(os.environ.get("WILDSNAP_RESULT_TTL", 600))  # seconds
+# Stored frames are only drawn on, so they are kept at most this long side
+RESULT_MAX_SIDE = int(os.environ.get("WILDSNAP_RESULT_MAX_SIDE", 1280))
+
+
+class ResultNotFound(KeyError):
+    """Unknown or expired result id, or a model not in that result"""
+
+
+class ResultCache:
+    """
+    LRU of detection results: entries older than ttl (since put) are dropped,
+    then least recently used ones until the total is within max_bytes
+    """
+
+    def __init__(self, max_bytes, ttl, max_side=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_side = max_side
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _shrink(self, frame, scale):
+        """Downscale a frame to max_side, adjusting its scale to match"""
+        height, width = frame.shape[:2]
+        if not self.max_side or max(width, height) <= self.max_side:
+            return frame, scale
+        image = Image.fromarray(frame)
+        image.thumbnail((self.max_side, self.max_side), Image.BILINEAR)
+        new_width, new_height = image.size
+        scale = (scale[0] * new_width / width, scale[1] * new_height / height)
+        return np.asarray(image), scale
+
+    def put(self, frame, scale, detections_by_model):
+        """
+        Store a decoded frame and its per-model detections
+        Returns: the result id, or None if the entry can't fit in max_bytes
+        """
+        frame, scale = self._shrink(frame, scale)
+        if frame.nbytes > self.max_bytes:
+            return None
+        result_id = uuid.uuid4().hex
+        entry = {
+            'frame': frame,
+            'scale': scale,
+            'detections': detections_by_model,
+            'created': time.time(),
+            'renders': {},
+            'bytes': frame.nbytes
+        }
+        with self._lock:
+            self._entries[result_id] = entry
+            self._bytes += entry['bytes']
+            self._evict()
+        return result_id
+
+    def get(self, result_id):
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(result_id)
+            if entry is None:
+                raise ResultNotFound(result_id)
+            # Access order says nothing about age, so check it here too
+            if time.time() - entry['created'] > self.ttl:
+                self._drop(result_id)
+                raise ResultNotFound(result_id)
+            self._entries.move_to_end(result_id)
+            return entry
+
+    def add_render(self, result_id, key, rendered):
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry is None or key in entry['renders']:
+                return
+            entry['renders'][key] = rendered
+            entry['bytes'] += len(rendered[0])
+            self._bytes += len(rendered[0])
+            self._evict()
+
+    def _drop(self, result_id):
+        entry = self._entries.pop(result_id)
+        self._bytes -= entry['bytes']
+
+    def _evict(self):
+        now = time.time()
+        expired = [
+            result_id for result_id, entry in self._entries.items()
+            if now - entry['created'] > self.ttl
+        ]
+        for result_id in expired:
+            self._drop(result_id)
+        while self._entries and self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+
+results_cache = ResultCache(RESULT_CACHE_MB * 1024 * 1024, RESULT_TTL, RESULT_MAX_SIDE)
+
+
+def render_result_image(result_id, model_key=None, size=None, fmt='png'):
+    """
+    Annotated image for a cached result, rendered on first request
+    size limits the long side in pixels; fmt is png, jpeg or webp
+    Returns: image bytes, mimetype
+    """
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}', use one of {', '.join(IMAGE_FORMATS)}")
+    if size is not None and size <= 0:
+        raise ValueError("size must be a positive number of pixels")
+
+    entry = results_cache.get(result_id)
+    if model_key is None:
+        model_key = next(iter(entry['detections']), None)
+    if model_key not in entry['detections']:
+        raise ResultNotFound(f"{result_id}/{model_key}")
+
+    key = (model_key, size, fmt)
+    rendered = entry['renders'].get(key)
+    if rendered is not None:
+        return rendered
+
+    annotated = render_detections(entry['frame'], entry['detections'][model_key], entry['scale'])
+    image = Image.fromarray(annotated)
+    if size:
+        image.thumbnail((size, size))
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    rendered = encode_image(image, fmt)
+    results_cache.add_render(result_id, key, rendered)
+    return rendered
@@ -0,0 +1,211 @@
+"""
+Per-camera regions of interest for WildSnap
+A profile has "include" shapes, whose bounding area the frame is cropped to
+before inference, and "exclude" shapes, where detections are dropped.
+Shapes are {"rect": [x1, y1, x2, y2]} or {"polygon": [[x, y], ...]} in
+fractions (0-1) of the full frame, so they hold at any upload resolution.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+
+
+# --- CONFIGURATION ---
+ROI_FILE = os.environ.get("WILDSNAP_ROI_FILE", "roi_profiles.json")
+
+CAMERA_ID_RE = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+_profiles = None
+_lock = threading.Lock()
+
+
+# --- VALIDATION ---
+
+def _check_point(x, y):
+    # bool is an int subclass, but true/false are not coordinates
+    if not all(
+        isinstance(v, (int, float)) and not isinstance(v, bool) and 0 <= v <= 1
+        for v in (x, y)
+    ):
+        raise ValueError("ROI coordinates must be numbers between 0 and 1")
+
+def validate_shape(shape):
+    """Normalise one shape, raising ValueError if it is malformed"""
+    if not isinstance(shape, dict):
+        raise ValueError("Each ROI shape must be an object with 'rect' or 'polygon'")
+
+    if 'rect' in shape:
+        rect = shape['rect']
+        if not isinstance(rect, list) or len(rect) != 4:
+            raise ValueError("'rect' must be [x1, y1, x2, y2]")
+        x1, y1, x2, y2 = rect
+        _check_point(x1, y1)
+        _check_point(x2, y2)
+        if x2 <= x1 or y2 <= y1:
+            raise ValueError("'rect' must have x2 > x1 and y2 > y1")
+        return {'rect': [x1, y1, x2, y2]}
+
+    if 'polygon' in shape:
+        points = shape['polygon']
+        if not isinstance(points, list) or len(points) < 3:
+            raise ValueError("'polygon' needs at least 3 [x, y] points")
+        for point in points:
+            if not isinstance(point, list) or len(point) != 2:
+                raise ValueError("'polygon' points must be [x, y]")
+            _check_point(*point)
+        return {'polygon': [list(p) for p in points]}
+
+    raise ValueError("Each ROI shape must have 'rect' or 'polygon'")
+
+def validate_profile(data):
+    """
+    Build a profile from a request body
+    Returns: {"include": [...], "exclude": [...]}
+    """
+    if not isinstance(data, dict):
+        raise ValueError("ROI profile must be a JSON object")
+    profile = {}
+    for key in ('include', 'exclude'):
+        shapes = data.get(key, [])
+        if not isinstance(shapes, list):
+            raise ValueError(f"'{key}' must be a list of shapes")
+        profile[key] = [validate_shape(s) for s in shapes]
+
+    # The frame is cropped to the include bounds, which must not be empty
+    for shape in profile['include']:
+        x1, y1, x2, y2 = _shape_bounds(shape)
+        if x2 <= x1 or y2 <= y1:
+            raise ValueError("Include shapes must cover an area, not a line or point")
+    return profile
+
+# --- STORAGE ---
+
+def _load():
+    global _profiles
+    if _profiles is None:
+        try:
+            with open(ROI_FILE) as f:
+                _profiles = json.load(f)
+        except FileNotFoundError:
+            _profiles = {}
+    return _profiles
+
+def _save():
+    tmp_path = f"{ROI_FILE}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(_profiles, f, indent=2)
+    os.replace(tmp_path, ROI_FILE)
+
+def list_profiles():
+    with _lock:
+        return dict(_load())
+
+def get_profile(camera_id):
+    """Profile for a camera, or None"""
+    if not camera_id:
+        return None
+    with _lock:
+        return _load().get(camera_id)
+
+def set_profile(camera_id, data):
+    if not CAMERA_ID_RE.match(camera_id or ''):
+        raise ValueError("camera_id may only contain letters, digits, '.', '_' and '-'")
+    profile = validate_profile(data)
+    with _lock:
+        _load()[camera_id] = profile
+        _save()
+    return profile
+
+def delete_profile(camera_id):
+    """Returns: True if a profile was removed"""
+    with _lock:
+        profiles = _load()
+        if camera_id not in profiles:
+            return False
+        del profiles[camera_id]
+        _save()
+    return True
+
+# --- GEOMETRY ---
+
+def _shape_bounds(shape):
+    if 'rect' in shape:
+        return shape['rect']
+    xs = [p[0] for p in shape['polygon']]
+    ys = [p[1] for p in shape['polygon']]
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+def include_bounds(profile):
+    """Normalised (x1, y1, x2, y2) around all include shapes, or None for the full frame"""
+    shapes = profile.get('include') if profile else None
+    if not shapes:
+        return None
+    bounds = [_shape_bounds(s) for s in shapes]
+    return (
+        min(b[0] for b in bounds), min(b[1] for b in bounds),
+        max(b[2] for b in bounds), max(b[3] for b in bounds)
+    )
+
+def crop_frame(img_np, profile):
+    """
+    Crop a decoded frame to the profile's include area (a view, no copy)
+    Returns: cropped frame, (offset_x, offset_y) of the crop in the frame
+    """
+    region = include_bounds(profile)
+    if region is None:
+        return img_np, (0, 0)
+
+    height, width = img_np.shape[:2]
+    x1 = max(0, math.floor(region[0] * width))
+    y1 = max(0, math.floor(region[1] * height))
+    x2 = min(width, math.ceil(region[2] * width))
+    y2 = min(height, math.ceil(region[3] * height))
+    return img_np[y1:y2, x1:x2], (x1, y1)
+
+def offset_detections(detections, offset):
+    """Shift detections from crop to frame coordinates"""
+    dx, dy = offset
+    if dx == 0 and dy == 0:
+        return detections
+    for d in detections:
+        x1, y1, x2, y2 = d['bbox']
+        d['bbox'] = [x1 + dx, y1 + dy, x2 + dx, y2 + dy]
+    return detections
+
+def _point_in_shape(x, y, shape):
+    if 'rect' in shape:
+        x1, y1, x2, y2 = shape['rect']
+        return x1 <= x <= x2 and y1 <= y <= y2
+
+    # Ray casting
+    inside = False
+    points = shape['polygon']
+    j = len(points) - 1
+    for i in range(len(points)):
+        xi, yi = points[i]
+        xj, yj = points[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+def drop_excluded(detections, profile, frame_size):
+    """
+    Remove detections whose box centre lies in an exclude shape
+    frame_size is the (width, height) the detection boxes refer to
+    """
+    shapes = profile.get('exclude') if profile else None
+    if not shapes:
+        return detections
+
+    width, height = frame_size
+    kept = []
+    for d in detections:
+        x1, y1, x2, y2 = d['bbox']
+        cx, cy = (x1 + x2) / 2 / width, (y1 + y2) / 2 / height
+        if not any(_point_in_shape(cx, cy, s) for s in shapes):
+            kept.append(d)
+    return kept
@@ -0,0 +1,276 @@
+"""
+Serving helpers for WildSnap
+Inference setup, request parsing and JSON payloads shared by the
+Flask (backend.py) and async (asgi_backend.py) APIs
+"""
+
+import os
+from datetime import datetime
+from PIL import Image
+from detection import (
+    models, load_models, decode_image, run_detection, build_result,
+    render_detections, scale_detections, decode_metrics_snapshot, encode_image_to_base64
+)
+from inference_pool import InferencePool, WorkerCrashed
+from profiling import profiled, is_admin, list_profiles, profiles_summary
+import roi
+from results_cache import render_result_image, results_cache, ResultNotFound
+
+
+# --- INFERENCE SETUP ---
+# 0 runs inference in the serving process, N > 0 starts N worker processes
+INFERENCE_WORKERS = int(os.environ.get("WILDSNAP_INFERENCE_WORKERS", 0))
+# Seconds a request waits for a free worker, and then for its result, before
+# the worker is treated as hung; keep twice this below the server's timeout
+INFERENCE_TIMEOUT = int(os.environ.get("WILDSNAP_INFERENCE_TIMEOUT", 60))
+inference_pool = None
+
+def init_inference():
+    """Load models in-process or start the inference worker pool"""
+    global inference_pool
+    if INFERENCE_WORKERS > 0:
+        inference_pool = InferencePool(INFERENCE_WORKERS, job_timeout=INFERENCE_TIMEOUT)
+        inference_pool.start()
+    else:
+        load_models()
+
+MODEL_ERRORS = {
+    'yolov8n': 'YOLOv8n model not available',
+    'best': 'best.pt model not available'
+}
+
+API_INFO = {
+    'app': 'WildSnap API',
+    'version': '1.0.0',
+    'endpoints': {
+        '/api/health': 'Health check',
+        '/api/detect': 'POST - Detect animals in base64 image',
+        '/api/detect-file': 'POST - Detect animals in uploaded file',
+        '/api/models': 'GET - List available models',
+        '/api/metrics': 'GET - Decode time and memory saved',
+        '/api/results/<id>/image': 'GET - Annotated image for a detect result (model, size, format)',
+        '/api/cameras': 'GET - List camera ROI profiles',
+        '/api/cameras/<id>/roi': 'GET/PUT/DELETE - Camera region of interest and exclusion masks',
+        '/api/profiles': 'GET - List saved request profiles (admin)',
+        '/api/profiles/summary': 'GET - Hottest functions across profiles (admin)',
+        '/api/profiles/<id>': 'GET - Download a cProfile trace (admin)'
+    }
+}
+
+def models_loaded():
+    """Availability of each model, wherever inference runs"""
+    if inference_pool is not None:
+        return inference_pool.models_loaded()
+    return {key: model is not None for key, model in models.items()}
+
+def detect_frame(model_key, img_np, conf_threshold, iou_threshold, filter_animals=False,
+                 timings=None, render=True, profile=None):
+    """Run detection in the worker pool when enabled, else on this thread"""
+    if inference_pool is not None:
+        return inference_pool.run_detection(
+            model_key, img_np, conf_threshold, iou_threshold, filter_animals,
+            timings, render, profile
+        )
+    return profiled(
+        profile, None, run_detection,
+        model_key, img_np, conf_threshold, iou_threshold, filter_animals, timings, render
+    )
+
+def request_roi_profile(camera_id):
+    """
+    ROI profile for a detect request's camera_id, which must exist if given
+    Returns: (profile or None, None) or (None, (payload, status))
+    """
+    if not camera_id:
+        return None, None
+    profile = roi.get_profile(camera_id)
+    if profile is None:
+        return None, ({'error': f"No ROI profile for camera '{camera_id}'"}, 404)
+    return profile, None
+
+def decode_upload(image_data, roi_profile=None):
+    """Decode an upload, keeping full inference resolution inside the camera ROI"""
+    return decode_image(image_data, region=roi.include_bounds(roi_profile))
+
+# --- REQUEST PARSING ---
+
+def parse_detect_json(data):
+    """
+    Read /api/detect parameters from a JSON body
+    Returns: image_data, model_choice, confidence, iou, filter_animals
+    """
+    return (
+        data.get('image'),
+        data.get('model', 'yolov8n'),
+        float(data.get('confidence', 0.4)),
+        float(data.get('iou', 0.5)),
+        data.get('filter_animals', False)
+    )
+
+def parse_detect_form(form):
+    """
+    Read /api/detect-file parameters from multipart form fields
+    Returns: model_choice, confidence, iou, filter_animals
+    """
+    return (
+        form.get('model', 'yolov8n'),
+        float(form.get('confidence', 0.4)),
+        float(form.get('iou', 0.5)),
+        form.get('filter_animals', 'false').lower() == 'true'
+    )
+
+def is_flag_set(value):
+    """Interpret a boolean JSON/form field, e.g. profile or inline_image"""
+    return str(value).lower() == 'true'
+
+# --- PAYLOADS ---
+# Each returns (payload, status) so both frameworks can jsonify it
+
+def detection_payload(img_np, model_choice, confidence, iou, filter_animals, profile=None,
+                      scale=(1, 1), inline_image=False, roi_profile=None, store_result=True):
+    """
+    Run the requested model(s) on a decoded frame, saving the profile if any
+    Boxes are mapped back to original image coordinates using decode_image's scale
+    Annotated images are rendered lazily via image_url unless inline_image is set;
+    with store_result off (callers that only draw the boxes) neither is produced
+    With a camera ROI profile only the include area goes to the model and
+    detections centred in exclude shapes are dropped
+    """
+    if model_choice == 'compare':
+        model_keys = ['yolov8n', 'best']
+    elif model_choice in MODEL_ERRORS:
+        model_keys = [model_choice]
+    else:
+        model_keys = []
+
+    available = models_loaded()
+    for key in model_keys:
+        if not available.get(key):
+            return {'error': MODEL_ERRORS[key]}, 500
+
+    frame, offset = roi.crop_frame(img_np, roi_profile)
+    original_size = (img_np.shape[1] / scale[0], img_np.shape[0] / scale[1])
+    # The model's own plot would only cover the crop, so ROI results are drawn here
+    model_render = inline_image and roi_profile is None
+
+    results = {}
+    try:
+        for key in model_keys:
+            timings = {} if profile is not None else None
+            ann_img, detections, inf_time = detect_frame(
+                key, frame, confidence, iou, filter_animals, timings, model_render, profile
+            )
+            detections = roi.offset_detections(detections, offset)
+            detections = scale_detections(detections, scale)
+            if roi_profile is not None:
+                detections = roi.drop_excluded(detections, roi_profile, original_size)
+                if inline_image:
+                    ann_img = profiled(profile, None, render_detections, img_np, detections, scale)
+            results[key] = profiled(
+                profile, None, build_result, ann_img, detections, inf_time, timings
+            )
+            if profile is not None:
+                profile.stages[key] = timings
+    except WorkerCrashed as e:
+        print(f"Inference worker failure: {e}")
+        return {'error': 'Inference worker unavailable, please retry'}, 503
+
+    payload = {
+        'success': True,
+        'results': results,
+        'timestamp': datetime.now().isoformat()
+    }
+    if not inline_image and store_result and results:
+        result_id = results_cache.put(
+            img_np, scale, {key: result['detections'] for key, result in results.items()}
+        )
+        if result_id is None:
+            # Too large for the cache, so an image_url would only ever 404
+            for result in results.values():
+                annotated = render_detections(img_np, result['detections'], scale)
+                result['image'] = encode_image_to_base64(Image.fromarray(annotated))
+        else:
+            payload['result_id'] = result_id
+            for key, result in results.items():
+                result['image_url'] = f"/api/results/{result_id}/image?model={key}"
+    if profile is not None:
+        payload['profile_id'] = profile.save()
+    return payload, 200
+
+def health_payload():
+    available = models_loaded()
+    return {
+        'status': 'ok',
+        'models_loaded': {
+            'yolov8n': available.get('yolov8n', False),
+            'best': available.get('best', False)
+        }
+    }, 200
+
+def models_payload():
+    available = models_loaded()
+    return {
+        'models': {
+            'yolov8n': {
+                'available': available.get('yolov8n', False),
+                'type': 'YOLOv8 Nano',
+                'description': 'Lightweight general object detection'
+            },
+            'best': {
+                'available': available.get('best', False),
+                'type': 'Custom Model',
+                'description': 'Custom-trained animal detection model'
+            }
+        }
+    }, 200
+
+def profiles_payload(admin_token):
+    if not is_admin(admin_token):
+        return {'error': 'Admin token required'}, 403
+    return {'profiles': list_profiles()}, 200
+
+def profiles_summary_payload(admin_token, limit=20):
+    if not is_admin(admin_token):
+        return {'error': 'Admin token required'}, 403
+    return profiles_summary(limit), 200
+
+def metrics_payload():
+    return {'decode': decode_metrics_snapshot()}, 200
+
+def result_image(result_id, model_key, size, fmt):
+    """
+    Render (or fetch the cached render of) a result's annotated image
+    Returns: ((image bytes, mimetype), None) or (None, (payload, status))
+    """
+    try:
+        return render_result_image(result_id, model_key, size, fmt), None
+    except ResultNotFound:
+        return None, ({'error': 'Result not found or expired'}, 404)
+    except ValueError as e:
+        return None, ({'error': str(e)}, 400)
+
+def cameras_payload():
+    return {'cameras': roi.list_profiles()}, 200
+
+def camera_roi_payload(camera_id):
+    profile = roi.get_profile(camera_id)
+    if profile is None:
+        return {'error': 'No ROI profile for this camera'}, 404
+    return {'camera_id': camera_id, 'roi': profile}, 200
+
+def set_camera_roi_payload(camera_id, data, admin_token):
+    # Same rule as profiling: no configured token means no writes
+    if not is_admin(admin_token):
+        return {'error': 'Admin token required'}, 403
+    try:
+        profile = roi.set_profile(camera_id, data)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    return {'camera_id': camera_id, 'roi': profile}, 200
+
+def delete_camera_roi_payload(camera_id, admin_token):
+    if not is_admin(admin_token):
+        return {'error': 'Admin token required'}, 403
+    if not roi.delete_profile(camera_id):
+        return {'error': 'No ROI profile for this camera'}, 404
+    return {'success': True}, 200